@@ -3,13 +3,16 @@ from __future__ import annotations
 
 import os
 import uuid
-import json
+import functools
+from collections import Counter, deque
+import socket
 import asyncio
 import logging
+import orjson
+import pybase64
 from dotenv import load_dotenv
-from typing import Set, AsyncIterator
+from typing import Awaitable, Callable
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.middleware.cors import CORSMiddleware
 from starlette.websockets import WebSocketState # <-- 추가된 import
 import uvicorn
 
@@ -24,96 +27,355 @@ else:
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# orjson은 bytes를 반환하므로 인코딩/디코딩 없이 그대로 소켓에 실어 보냅니다.
+_dumps = orjson.dumps
+_loads = orjson.loads
+
+# 오디오 append 프레임은 구조가 고정되어 있으므로 base64 문자열만 끼워 넣어 조립합니다.
+# React 클라이언트도 같은 접두사의 append 프레임을 보내므로 파싱 없이 그대로 Azure에 전달합니다.
+_APPEND_PREFIX = b'{"type":"input_audio_buffer.append","audio":"'
+_APPEND_SUFFIX = b'","event_id":""}'
+_CLIENT_APPEND_SUFFIX = b'"}'
+# Azure 이벤트는 "type"이 맨 앞에 오므로 프레임 앞부분만 확인하면 충분합니다.
+_AUDIO_DELTA_TYPE = b'"response.audio.delta"'
+_TYPE_PEEK_LEN = 64
+# 한 번에 합치는 append 프레임의 최대 개수
+_COALESCE_MAX_FRAMES = 128
+# 수신 루프와 송신 루프 사이 큐의 크기 (클라이언트 방향은 넘치면 가장 오래된 오디오 델타를 버리고, Azure 방향은 대기)
+# 클라이언트 방향은 오디오 델타만 이 개수로 제한하며 제어 이벤트는 버리지 않습니다.
+_CLIENT_QUEUE_SIZE = 256
+# 클라이언트에 한 프레임(JSON 배열)으로 묶어 보내는 최대 이벤트 수
+_CLIENT_BATCH_MAX_FRAMES = 64
+_AZURE_QUEUE_SIZE = 64
+
+def _is_client_append(raw: str | bytes) -> bool:
+    """클라이언트 프레임이 Azure에 그대로 전달해도 되는 append 프레임인지 확인합니다."""
+    # 마지막 따옴표 외에 다른 따옴표가 없어야 base64 자리에 다른 필드를 끼워 넣을 수 없습니다.
+    # 텍스트 프레임으로 검증 없이 보내므로 ASCII만 허용하고, JSON 문자열을 깨뜨리는 역슬래시도 막습니다.
+    return (isinstance(raw, bytes) and raw.startswith(_APPEND_PREFIX) and raw.endswith(_CLIENT_APPEND_SUFFIX)
+            and raw.find(b'"', len(_APPEND_PREFIX)) == len(raw) - len(_CLIENT_APPEND_SUFFIX)
+            and raw.isascii() and b"\\" not in raw)
+
+def _append_audio(frame: bytes) -> memoryview:
+    """append 프레임에서 base64 오디오 부분을 복사 없이 memoryview로 가리킵니다."""
+    start = len(_APPEND_PREFIX)
+    return memoryview(frame)[start:frame.index(b'"', start)]
+
+def _merge_appends(frames: list[bytes]) -> bytes:
+    """여러 append 프레임을 하나의 append 프레임으로 합칩니다."""
+    if len(frames) == 1:
+        return frames[0]
+    # 각 청크는 패딩('=')으로 끝날 수 있으므로 디코딩 후 이어 붙여 다시 인코딩합니다.
+    # (pybase64는 SIMD 가속 libbase64를 사용하고, memoryview를 복사 없이 그대로 받습니다.)
+    audio = b"".join(pybase64.b64decode(_append_audio(frame)) for frame in frames)
+    return b"".join([_APPEND_PREFIX, pybase64.b64encode(audio), _APPEND_SUFFIX])
+
+# 매 연결/발화마다 같은 내용이므로 모듈 로드 시 한 번만 직렬화합니다.
+_SESSION_UPDATE_FRAME = _dumps({
+    "type": "session.update",
+    "session": {
+        "instructions": (
+            "You are a friendly and helpful AI assistant. "
+            "Speak in a natural, conversational tone. "
+            "Keep your responses concise and to the point, ideally under 6 sentences, unless asked for details. "
+            "Avoid long lists and overly formal language."
+        ),
+        "turn_detection": {
+            "type": "azure_semantic_vad",
+            "threshold": 0.5, # 발화 종료 판단 민감도
+            "prefix_padding_ms": 300,
+            "silence_duration_ms": 1200,
+            "remove_filler_words": False,
+            "end_of_utterance_detection": {
+                "model": "semantic_detection_v1",
+                "threshold": 0.01,
+                "timeout": 0.5,
+            },
+        },
+        "input_audio_noise_reduction": {
+            "type": "azure_deep_noise_suppression"
+        },
+        "input_audio_echo_cancellation": {
+            "type": "server_echo_cancellation"
+        },
+        "voice": {
+            "name": "en-US-Ava:DragonHDLatestNeural", 
+            "temperature": 0.8,
+        },
+    },
+    "event_id": "" # event_id는 보통 비워둡니다.
+})
+_COMMIT_FRAME = _dumps({"type": "input_audio_buffer.commit", "event_id": ""})
+
 # --- FastAPI 애플리케이션 설정 ---
+# /ws 외에는 프론트엔드가 호출하는 HTTP 엔드포인트가 없고, CORS는 WebSocket 연결에 적용되지 않으므로
+# CORSMiddleware를 두지 않습니다. (HTTP API를 추가하게 되면 그때 허용 origin과 함께 다시 등록)
 app = FastAPI()
-# 배포된 프론트엔드의 주소를 정확하게 명시해줍니다.
-origins = [
-    "https://live-voice-agent-frontend-935733163938.asia-northeast3.run.app",
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins, # 등록된 주소만 허용
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
 # --- Azure Voice Live API 관련 클래스 ---
 from websockets.asyncio.client import connect as ws_connect
 from websockets.asyncio.client import ClientConnection as AsyncWebsocket
 from websockets.asyncio.client import HeadersLike
 from websockets.typing import Data
-from websockets.exceptions import WebSocketException
+from websockets.exceptions import WebSocketException, ConnectionClosedOK
+
+class AzureSessionError(Exception):
+    """session.created 전에 Azure가 error 이벤트를 보내 세션을 만들 수 없을 때 발생합니다."""
 
 class AsyncVoiceLiveConnection:
     _connection: AsyncWebsocket
+    # 오디오마다 호출되는 경로이므로 __aenter__에서 하위 연결의 메서드를 직접 바인딩합니다. (래퍼 프레임 생략)
+    # decode=False로 recv하면 텍스트 프레임도 UTF-8 디코딩 없이 bytes로 받습니다.
+    recv: Callable[..., Awaitable[Data]]
+    send: Callable[[Data], Awaitable[None]]
     def __init__(self, url: str, additional_headers: HeadersLike) -> None:
         self._url, self._additional_headers, self._connection = url, additional_headers, None
+        self._sock = None
     async def __aenter__(self) -> AsyncVoiceLiveConnection:
         try:
-            self._connection = await ws_connect(self._url, additional_headers=self._additional_headers)
+            self._connection = await ws_connect(
+                self._url,
+                additional_headers=self._additional_headers,
+                # 중계 서버이므로 메시지 크기 제한을 두지 않습니다. (큰 오디오 묶음마다 크기 검사/재할당 방지)
+                max_size=None,
+                # 수신 큐를 넉넉히 잡아 몰려오는 오디오 델타에 읽기가 멈추지 않도록 합니다.
+                max_queue=64,
+                # base64 오디오는 거의 압축되지 않아 permessage-deflate는 작은 프레임마다 CPU만 소모하므로 끕니다.
+                compression=None,
+                # 유휴 구간에 NAT/프록시가 연결을 끊어 비싼 재연결(TLS + session.update)이 일어나지 않도록 keepalive를 짧게 유지합니다.
+                ping_interval=15,
+                ping_timeout=10,
+                close_timeout=1,
+            )
         except Exception as e:
             logger.error(f"🔴 FAILED to establish WebSocket connection to Azure: {e}", exc_info=True)
             raise
+        self._tune_socket()
+        self.recv = self._connection.recv
+        # Azure는 텍스트 프레임만 받으므로 orjson의 bytes 출력도 텍스트 프레임으로 전송합니다.
+        self.send = functools.partial(self._connection.send, text=True)
         return self
+    def _tune_socket(self) -> None:
+        # 20~60ms 단위의 작은 오디오 프레임이 Nagle 알고리즘에 묶여 지연되지 않도록 즉시 전송합니다.
+        # (브라우저와 uvicorn의 asyncio/uvloop 트랜스포트는 이미 TCP_NODELAY를 켜므로 서버 측 Azure 연결도 맞춰줍니다.)
+        sock = self._sock = self._connection.transport.get_extra_info("socket")
+        if sock is None: return
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Linux에서는 지연 ACK도 끄고 바로 ACK를 보냅니다. (커널이 다시 켤 수 있어 연결 직후 한 번만 설정)
+        if hasattr(socket, "TCP_QUICKACK"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        # WebSocket ping과 별개로 커널 수준의 keepalive도 켜서 조용히 끊긴 연결을 감지합니다.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    def set_cork(self, enabled: bool) -> None:
+        # 연달아 보내는 프레임을 커널에서 한 세그먼트로 묶습니다. (Linux 전용, 해제 시 즉시 전송)
+        if self._sock is None or not hasattr(socket, "TCP_CORK"): return
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CORK, int(enabled))
     async def __aexit__(self, exc_type, exc_value, traceback) -> None:
         if self._connection: await self._connection.close()
-    async def recv(self) -> Data: return await self._connection.recv()
-    async def __aiter__(self) -> AsyncIterator[Data]:
-        async for data in self._connection: yield data
-    async def send(self, message: Data) -> None: await self._connection.send(message)
 
 class AsyncAzureVoiceLive:
     def __init__(self, *, azure_endpoint: str, api_version: str, api_key: str) -> None:
-        self._azure_endpoint, self._api_version, self._api_key = azure_endpoint, api_version, api_key
+        if not azure_endpoint.startswith("https://"):
+            raise ValueError(f"Azure endpoint must start with https://: {azure_endpoint}")
+        self._api_version = api_version
+        # https:// 접두사만 잘라 wss:// 주소의 공통 부분을 미리 만들어 둡니다.
+        self._ws_base = "wss://" + azure_endpoint.removeprefix("https://").rstrip("/")
+        # 요청 ID는 세션(클라이언트 인스턴스)당 한 번만 만들고, 헤더도 미리 구성해 재연결 시 재사용합니다.
+        self._headers = {"api-key": api_key, "x-ms-client-request-id": uuid.uuid4().hex}
     def connect(self, model: str) -> AsyncVoiceLiveConnection:
-        url = f"{self._azure_endpoint.rstrip('/')}/voice-live/realtime?api-version={self._api_version}&model={model}".replace("https://", "wss://")
-        headers = {"api-key": self._api_key, "x-ms-client-request-id": str(uuid.uuid4())}
-        return AsyncVoiceLiveConnection(url, additional_headers=headers)
+        url = f"{self._ws_base}/voice-live/realtime?api-version={self._api_version}&model={model}"
+        return AsyncVoiceLiveConnection(url, additional_headers=self._headers)
 
 # --- WebSocket 통신 로직 ---
-async def react_to_azure(react_ws: WebSocket, azure_ws: AsyncVoiceLiveConnection):
-    """React 클라이언트로부터 메시지를 받아 Azure로 전달합니다."""
+async def _receive_frame(ws: WebSocket) -> str | bytes:
+    """클라이언트 프레임을 텍스트/바이너리 구분 없이 그대로 받습니다. (바이너리는 str 변환 없이 orjson으로 바로 파싱)"""
+    message = await ws.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    text = message.get("text")
+    return message["bytes"] if text is None else text
+
+async def react_to_azure(react_ws: WebSocket, outbound: asyncio.Queue):
+    """React 클라이언트로부터 메시지를 받아 Azure 전송 큐에 넣습니다."""
     try:
         while True:
-            data = await react_ws.receive_json()
-            if data.get("type") == "audio":
-                # 오디오 청크를 Azure가 기대하는 포맷으로 감싸서 전송
-                azure_payload = {
-                    "type": "input_audio_buffer.append",
-                    "audio": data.get("audio"),
-                    "event_id": "" # 필요시 event_id 추가
-                }
-                await azure_ws.send(json.dumps(azure_payload))
-            elif data.get("type") == "recording_stopped":
-                # 녹음 중지 시 commit 메시지 전송
-                await azure_ws.send(json.dumps({"type": "input_audio_buffer.commit", "event_id": ""}))
-                logger.info("➡️ Received recording_stopped. Sent 'commit' message to Azure.")
+            raw = await _receive_frame(react_ws)
+            # 오디오 append 프레임은 파싱 없이 그대로 큐에 넣고 azure_writer가 모아서 전송
+            if _is_client_append(raw):
+                await outbound.put(raw)
+                continue
+
+            data = _loads(raw)
+            message_type = data.get("type")
+            if message_type == "recording_stopped":
+                # 녹음 중지 시 commit 메시지 전송 (대기 중인 오디오를 먼저 내보낸 뒤 전송됨)
+                await outbound.put(_COMMIT_FRAME)
+                logger.info("➡️ Received recording_stopped. Queued 'commit' message for Azure.")
+            elif message_type in ("input_audio_buffer.append", "audio"):
+                # 빠른 경로 형식이 아닌 오디오(텍스트 프레임, 다른 키 순서, 이전 {"type":"audio"} 형식)는 다시 감싸서 전달
+                audio = data.get("audio")
+                frame = _APPEND_PREFIX + audio.encode() + _CLIENT_APPEND_SUFFIX if isinstance(audio, str) else b""
+                if _is_client_append(frame):
+                    await outbound.put(frame)
+                else:
+                    logger.warning("⚠️ Ignored an audio message with invalid audio data from the client.")
+            else:
+                logger.warning("⚠️ Ignored an unknown message type from the client: %s", message_type)
     except WebSocketDisconnect:
         logger.warning("React client disconnected.")
         raise
 
-async def azure_to_react(react_ws: WebSocket, azure_ws: AsyncVoiceLiveConnection):
-    """Azure로부터 응답을 받아 React 클라이언트로 전달합니다."""
+async def azure_writer(azure_ws: AsyncVoiceLiveConnection, outbound: asyncio.Queue, session_ready: asyncio.Event):
+    """전송 큐에 이미 쌓인 오디오를 하나의 append 프레임으로 합쳐 Azure에 전달합니다.
+
+    제어 프레임(예: commit)이 들어오면 모아둔 오디오를 먼저 보낸 뒤 그대로 전송합니다.
+    """
+    # 세션이 만들어지기 전에 들어온 오디오는 큐에 쌓아 두었다가 이후에 전송합니다.
+    await session_ready.wait()
+    while True:
+        item = await outbound.get()
+        appends = []
+        while item is not None and item.startswith(_APPEND_PREFIX) and len(appends) < _COALESCE_MAX_FRAMES:
+            appends.append(item)
+            # 이미 큐에 쌓여 있는 프레임만 꺼내 합칩니다. (react_writer와 같은 방식)
+            item = outbound.get_nowait() if not outbound.empty() else None
+        # 오디오와 뒤따르는 제어 프레임(예: commit)을 연달아 보낼 때는 TCP_CORK로 묶어 한 번에 내보냅니다.
+        burst = bool(appends) and item is not None
+        if burst: azure_ws.set_cork(True)
+        try:
+            if appends:
+                await azure_ws.send(_merge_appends(appends))
+            if item is not None:
+                await azure_ws.send(item)
+        finally:
+            if burst: azure_ws.set_cork(False)
+
+class _ClientSendQueue:
+    """클라이언트 전송 큐. 오디오 델타가 audio_limit개를 넘으면 가장 오래된 델타만 버립니다.
+
+    제어 이벤트는 버리지 않으며 순서도 그대로 유지하고, 버린 개수는 넘침이 끝날 때 한 번만 기록합니다.
+    """
+    def __init__(self, audio_limit: int) -> None:
+        # (오디오 여부, 프레임) 쌍으로 보관해 꺼낼 때 프레임을 다시 검사하지 않습니다.
+        self._frames: deque[tuple[bool, bytes]] = deque()
+        self._ready = asyncio.Event()
+        self._audio_limit = audio_limit
+        self._audio_count = 0
+        self._overflow_drops = 0
+        self.dropped = 0
+
+    def put_control(self, frame: bytes) -> None:
+        self._frames.append((False, frame))
+        self._ready.set()
+
+    def put_audio(self, frame: bytes) -> None:
+        if self._audio_count < self._audio_limit:
+            self._audio_count += 1
+            if self._overflow_drops:
+                logger.warning("Client send queue recovered. Dropped %d audio frames.", self._overflow_drops)
+                self._overflow_drops = 0
+        else:
+            # 제어 이벤트는 건너뛰고 가장 앞(오래된) 오디오 델타 하나를 제거합니다. (개수는 그대로)
+            for index, (is_audio, _) in enumerate(self._frames):
+                if is_audio:
+                    del self._frames[index]
+                    break
+            if not self._overflow_drops:
+                logger.warning("Client send queue is full. Dropping the oldest audio frames.")
+            self._overflow_drops += 1
+            self.dropped += 1
+        self._frames.append((True, frame))
+        self._ready.set()
+
+    def empty(self) -> bool:
+        return not self._frames
+
+    def get_nowait(self) -> bytes:
+        is_audio, frame = self._frames.popleft()
+        if is_audio:
+            self._audio_count -= 1
+        return frame
+
+    async def get(self) -> bytes:
+        while not self._frames:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.get_nowait()
+
+async def react_writer(react_ws: WebSocket, inbound: _ClientSendQueue):
+    """수신 큐의 프레임을 React 클라이언트로 전송합니다.
+
+    이미 큐에 쌓인 이벤트는 기다리지 않고 모아서 JSON 배열 하나로 보냅니다.
+    각 이벤트는 이미 JSON이므로 파싱 없이 쉼표로 이어 붙이기만 합니다.
+    """
+    while True:
+        frame = await inbound.get()
+        if inbound.empty():
+            await react_ws.send_bytes(frame)
+            continue
+        frames = [frame]
+        while not inbound.empty() and len(frames) < _CLIENT_BATCH_MAX_FRAMES:
+            frames.append(inbound.get_nowait())
+        await react_ws.send_bytes(b"[" + b",".join(frames) + b"]")
+
+async def azure_to_react(azure_ws: AsyncVoiceLiveConnection, inbound: _ClientSendQueue, session_ready: asyncio.Event):
+    """Azure로부터 응답을 받아 클라이언트 전송 큐에 넣습니다.
+
+    느린 클라이언트가 Azure 수신을 막지 않도록 전송은 react_writer가 따로 담당합니다.
+    session.created를 받으면 session_ready를 설정해 azure_writer가 오디오 전송을 시작하게 합니다.
+    """
+    # 루프마다 속성 조회를 반복하지 않도록 recv 메서드를 지역 변수에 바인딩합니다.
+    recv = azure_ws.recv
+    # 이벤트마다 로그를 남기는 대신 타입별 개수를 모아 세션 종료 시 한 번만 출력합니다.
+    event_counts = Counter()
     try:
-        async for raw_event in azure_ws:
-            event = json.loads(raw_event)
+        while True:
+            # 디코딩 없이 받은 bytes를 그대로 전달하여 str 변환/UTF-8 재인코딩을 생략
+            raw_event = await recv(decode=False)
+            # 오디오 델타는 파싱/재직렬화 없이 원본 프레임 그대로 전달
+            if raw_event.find(_AUDIO_DELTA_TYPE, 0, _TYPE_PEEK_LEN) != -1:
+                event_counts["response.audio.delta"] += 1
+                inbound.put_audio(raw_event)
+                continue
+
+            event = _loads(raw_event)
             event_type = event.get("type")
+            event_counts[event_type] += 1
+
+            # transcript delta 등 빈번한 *.delta 이벤트는 DEBUG에서만 출력 (error는 아래에서 전체 내용을 ERROR로 기록)
+            if event_type and event_type.endswith(".delta"):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("⬅️ Received from Azure: %s (%d bytes)", event_type, len(raw_event))
+            elif event_type != "error":
+                logger.info("⬅️ Received from Azure: %s (%d bytes)", event_type, len(raw_event))
+                logger.debug("⬅️ Event payload: %s", event)
 
-            # 오디오 데이터 외의 로그는 터미널에 출력
-            if event_type != "response.audio.delta":
-                 logger.info(f"⬅️ Received from Azure: {event}")
-            
+            if event_type == "session.created":
+                logger.info("✅ Azure session successfully created.")
+                session_ready.set()
+                inbound.put_control(raw_event)
+            elif event_type == "error":
+                if not session_ready.is_set():
+                    logger.error(f"🔴 Azure returned an error during session creation: {event}")
+                    raise AzureSessionError(f"Azure error: {event.get('error', {}).get('message')}")
+                # 세션 도중의 error는 클라이언트에 전달하지 않으므로 전체 내용을 로그로 남깁니다.
+                logger.error(f"🔴 Azure returned an error: {event}")
             # 클라이언트에 필요한 이벤트만 전달
-            if event_type == "response.audio.delta":
-                await react_ws.send_text(json.dumps({"type": "audio", "audio": event.get("delta")}))
+            elif event_type == "response.audio.delta":
+                inbound.put_audio(raw_event)
             elif event_type in ["response.audio.started", "response.audio.done"]:
-                await react_ws.send_text(json.dumps(event))
+                inbound.put_control(raw_event)
 
+    except ConnectionClosedOK:
+        logger.info("Azure closed the connection.")
+        raise
     except WebSocketException as e:
-        logger.error(f"🔴 Azure WebSocket connection error: {e.code} {e.reason}", exc_info=True)
+        # ConnectionClosed 외의 WebSocketException에는 code/reason이 없으므로 예외 자체를 기록합니다.
+        logger.error(f"🔴 Azure WebSocket connection error: {e!r}", exc_info=True)
         raise
+    finally:
+        logger.info("📊 Events received from Azure this session: %s (dropped audio frames: %d)",
+                    dict(event_counts), inbound.dropped)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -129,74 +391,32 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close(code=1008, reason="Server environment variables not configured.")
         return
 
-    client = AsyncAzureVoiceLive(azure_endpoint=endpoint, api_version=api_version, api_key=api_key)
-    tasks: Set[asyncio.Task] = set()
     try:
+        client = AsyncAzureVoiceLive(azure_endpoint=endpoint, api_version=api_version, api_key=api_key)
         async with client.connect(model=model) as azure_connection:
             logger.info("✅ Successfully connected to Azure Voice Live API.")
 
-            # 1. 세션 업데이트 메시지 전송
-            session_update = {
-                "type": "session.update",
-                "session": {
-                    "instructions": (
-                        "You are a friendly and helpful AI assistant. "
-                        "Speak in a natural, conversational tone. "
-                        "Keep your responses concise and to the point, ideally under 6 sentences, unless asked for details. "
-                        "Avoid long lists and overly formal language."
-                    ),
-                    "turn_detection": {
-                        "type": "azure_semantic_vad",
-                        "threshold": 0.5, # 발화 종료 판단 민감도
-                        "prefix_padding_ms": 300,
-                        "silence_duration_ms": 1200,
-                        "remove_filler_words": False,
-                        "end_of_utterance_detection": {
-                            "model": "semantic_detection_v1",
-                            "threshold": 0.01,
-                            "timeout": 0.5,
-                        },
-                    },
-                    "input_audio_noise_reduction": {
-                        "type": "azure_deep_noise_suppression"
-                    },
-                    "input_audio_echo_cancellation": {
-                        "type": "server_echo_cancellation"
-                    },
-                    "voice": {
-                        "name": "en-US-Ava:DragonHDLatestNeural", 
-                        "temperature": 0.8,
-                    },
-                },
-                "event_id": "" # event_id는 보통 비워둡니다.
-            }
-            await azure_connection.send(json.dumps(session_update))
-            logger.info("Sent session update to Azure. Waiting for session.created confirmation...")
-
-            # 2. Azure로부터 'session.created' 응답을 기다림
-            session_created = False
-            while not session_created:
-                raw_event = await azure_connection.recv()
-                event = json.loads(raw_event)
-                logger.info(f"⬅️ Received from Azure during init: {event}")
-                if event.get("type") == "session.created":
-                    session_created = True
-                    logger.info("✅ Azure session successfully created.")
-                    await websocket.send_text(json.dumps(event))
-                elif event.get("type") == "error":
-                    logger.error(f"🔴 Azure returned an error during session creation: {event}")
-                    raise WebSocketException(f"Azure error: {event.get('error', {}).get('message')}")
-
-            # 3. 세션 생성이 확인된 후에 데이터 중계 태스크 시작
-            task_react_to_azure = asyncio.create_task(react_to_azure(websocket, azure_connection))
-            task_azure_to_react = asyncio.create_task(azure_to_react(websocket, azure_connection))
-            tasks.update([task_react_to_azure, task_azure_to_react])
+            # 1. 세션 업데이트 메시지 전송 (미리 직렬화해 둔 프레임)
+            await azure_connection.send(_SESSION_UPDATE_FRAME)
+            logger.info("Sent session update to Azure. Starting relay while waiting for session.created...")
 
-            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-            for task in pending: task.cancel()
+            # 2. session.created를 기다리지 않고 바로 데이터 중계 태스크 시작
+            # session.created는 azure_to_react가 처리하며, 그 전까지 클라이언트 오디오는 전송 큐에서 대기합니다.
+            # 한 태스크가 끝나면(예외 발생) TaskGroup이 나머지 태스크를 자동으로 취소합니다.
+            session_ready = asyncio.Event()
+            outbound: asyncio.Queue = asyncio.Queue(maxsize=_AZURE_QUEUE_SIZE)
+            inbound = _ClientSendQueue(_CLIENT_QUEUE_SIZE)
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(react_to_azure(websocket, outbound))
+                tg.create_task(azure_writer(azure_connection, outbound, session_ready))
+                tg.create_task(azure_to_react(azure_connection, inbound, session_ready))
+                tg.create_task(react_writer(websocket, inbound))
 
-    except Exception as e:
-        logger.error(f"🔴 Main websocket handler error: {e}", exc_info=True)
+    except* (WebSocketDisconnect, ConnectionClosedOK):
+        # 클라이언트 또는 Azure 쪽의 정상 종료 (각 태스크에서 이미 로그를 남김)
+        logger.info("Relay stopped because one side closed the connection.")
+    except* Exception as eg:
+        logger.error(f"🔴 Main websocket handler error: {eg.exceptions}", exc_info=True)
     finally:
         logger.warning("Connection cleanup initiated.")
         if websocket.client_state != WebSocketState.DISCONNECTED:
@@ -204,4 +424,12 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.warning("React client connection closed.")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    if os.environ.get("ENV") == "dev":
+        # 개발 환경: 코드 변경 시 자동 재시작 (reload는 단일 워커에서만 동작)
+        uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True, ws_per_message_deflate=False)
+    else:
+        # 운영 환경: uvloop + httptools 이벤트 루프, 워커 수는 WEB_CONCURRENCY로 늘립니다.
+        # (컨테이너 안에서는 os.cpu_count()가 CPU 제한이 아닌 호스트 코어 수를 돌려주므로 기본값은 1)
+        workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+        uvicorn.run("server:app", host="0.0.0.0", port=8000, loop="uvloop", http="httptools", ws="websockets",
+                    ws_per_message_deflate=False, workers=workers)
\ No newline at end of file
@@ -1,6 +1,46 @@
 import React, { useState, useEffect, useRef, useCallback } from 'react';
 import { Mic, MicOff, Power, PowerOff, Loader2 } from 'lucide-react';
 
+// 서버와는 JSON을 바이너리 프레임(UTF-8 bytes)으로 주고받습니다.
+const textDecoder = new TextDecoder();
+const textEncoder = new TextEncoder();
+
+// 서버로 보내는 메시지는 형식이 고정되어 있으므로 매번 JSON.stringify 하지 않고 미리 만들어 둡니다.
+// (오디오 프레임은 서버가 그대로 Azure에 전달하므로 접두사가 서버의 _APPEND_PREFIX와 같아야 합니다.)
+const APPEND_PREFIX = textEncoder.encode('{"type":"input_audio_buffer.append","audio":"');
+const APPEND_SUFFIX = textEncoder.encode('"}');
+const RECORDING_STOPPED_MESSAGE = JSON.stringify({ type: 'recording_stopped' });
+
+// base64 문자표를 바이트로 미리 인코딩해 두고, 오디오 바이트를 프레임 버퍼에 바로 base64로 써넣습니다.
+// (String.fromCharCode + btoa + encodeInto로 이어지는 중간 문자열 두 개를 만들지 않습니다.)
+const BASE64_ALPHABET = textEncoder.encode('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/');
+const BASE64_PAD = 61; // '='
+
+const encodeBase64Into = (bytes, out, offset) => {
+    const tail = bytes.length % 3;
+    const end = bytes.length - tail;
+    let o = offset;
+    for (let i = 0; i < end; i += 3) {
+        const n = (bytes[i] << 16) | (bytes[i + 1] << 8) | bytes[i + 2];
+        out[o++] = BASE64_ALPHABET[n >> 18];
+        out[o++] = BASE64_ALPHABET[(n >> 12) & 63];
+        out[o++] = BASE64_ALPHABET[(n >> 6) & 63];
+        out[o++] = BASE64_ALPHABET[n & 63];
+    }
+    if (tail) {
+        const n = (bytes[end] << 16) | (tail === 2 ? bytes[end + 1] << 8 : 0);
+        out[o++] = BASE64_ALPHABET[n >> 18];
+        out[o++] = BASE64_ALPHABET[(n >> 12) & 63];
+        out[o++] = tail === 2 ? BASE64_ALPHABET[(n >> 6) & 63] : BASE64_PAD;
+        out[o++] = BASE64_PAD;
+    }
+    return o;
+};
+
+// 녹음 블록 크기가 고정이라 프레임 길이도 매번 같으므로, 프레임 버퍼를 한 번 만들어 재사용합니다.
+// (WebSocket.send는 호출 시점에 데이터를 복사하므로 바로 다음 프레임에 덮어써도 안전합니다.)
+let appendFrame = new Uint8Array(0);
+
 function App() {
     const [isConnected, setIsConnected] = useState(false);
     const [isRecording, setIsRecording] = useState(false);
@@ -15,14 +55,24 @@ function App() {
     const sourceNodeRef = useRef(null);
     const audioQueueRef = useRef([]);
     const isPlayingRef = useRef(false);
+    // 다음 오디오 버퍼를 이어 붙일 AudioContext 시각과 아직 재생 중인 버퍼 수
+    const nextStartTimeRef = useRef(0);
+    const activeSourcesRef = useRef(0);
 
     // 오디오 데이터를 서버로 전송하는 함수
     const sendAudioData = useCallback((int16Data) => {
         if (wsRef.current?.readyState === WebSocket.OPEN) {
-            // Int16Array를 Base64 문자열로 변환
-            const u8 = new Uint8Array(int16Data.buffer);
-            const base64 = btoa(String.fromCharCode.apply(null, u8));
-            wsRef.current.send(JSON.stringify({ type: 'audio', audio: base64 }));
+            const u8 = new Uint8Array(int16Data.buffer, int16Data.byteOffset, int16Data.byteLength);
+            // Azure의 append 이벤트 형식으로 보내면 서버가 파싱 없이 그대로 전달합니다.
+            // 미리 인코딩한 접두사/접미사 사이에 Int16 PCM을 base64로 바로 써넣습니다.
+            const frameLength = APPEND_PREFIX.length + Math.ceil(u8.length / 3) * 4 + APPEND_SUFFIX.length;
+            if (appendFrame.length !== frameLength) {
+                appendFrame = new Uint8Array(frameLength);
+                appendFrame.set(APPEND_PREFIX);
+            }
+            const suffixOffset = encodeBase64Into(u8, appendFrame, APPEND_PREFIX.length);
+            appendFrame.set(APPEND_SUFFIX, suffixOffset);
+            wsRef.current.send(appendFrame);
         }
     }, []);
 
@@ -35,6 +85,7 @@ function App() {
         try {
             if (!audioContextRef.current || audioContextRef.current.state === 'closed') {
                 audioContextRef.current = new AudioContext({ sampleRate: 24000 });
+                nextStartTimeRef.current = 0;
             }
             if (audioContextRef.current.state === 'suspended') {
                 await audioContextRef.current.resume();
@@ -51,16 +102,17 @@ function App() {
             const processor = audioContextRef.current.createScriptProcessor(bufferSize, 1, 1);
             processorRef.current = processor;
 
+            // 콜백마다 새 배열을 만들지 않도록 변환 결과를 담을 버퍼를 한 번만 할당해 재사용합니다.
+            // (sendAudioData가 동기적으로 base64로 인코딩하므로 다음 콜백 전에 덮어써도 안전합니다.)
+            const pcmData = new Int16Array(bufferSize);
             processor.onaudioprocess = (e) => {
+                // 녹음 중일 때만 변환 및 전송
+                if (!isRecordingRef.current) return;
                 const inputData = e.inputBuffer.getChannelData(0);
-                const pcmData = new Int16Array(inputData.length);
                 for (let i = 0; i < inputData.length; i++) {
                     pcmData[i] = Math.max(-1, Math.min(1, inputData[i])) * 32767;
                 }
-                // 녹음 중일 때만 오디오 데이터 전송
-                if (isRecordingRef.current) {
-                    sendAudioData(pcmData);
-                }
+                sendAudioData(pcmData);
             };
 
             sourceNodeRef.current.connect(processor);
@@ -100,7 +152,7 @@ function App() {
         }
 
         if (wsRef.current?.readyState === WebSocket.OPEN) {
-            wsRef.current.send(JSON.stringify({ type: 'recording_stopped' }));
+            wsRef.current.send(RECORDING_STOPPED_MESSAGE);
         }
     }, []);
 
@@ -118,55 +170,65 @@ function App() {
     }, [isRecording, isConnected, isAISpeaking, startRecording, stopRecording]);
 
     // 오디오 큐를 재생하는 함수 (부드러운 재생을 위해 개선)
+    // 이전 버퍼가 끝나기(onended)를 기다리지 않고, 도착한 청크를 이전 버퍼가 끝나는 시각에 바로 이어 재생하도록 예약합니다.
     const playAudioQueue = useCallback(async () => {
         if (audioQueueRef.current.length === 0 || isPlayingRef.current) return;
 
         isPlayingRef.current = true;
         setIsAISpeaking(true);
 
-        const totalLength = audioQueueRef.current.reduce((acc, val) => acc + val.length, 0);
-        const concatenatedData = new Uint8Array(totalLength);
-        let offset = 0;
-        audioQueueRef.current.forEach((chunk) => {
-            concatenatedData.set(chunk, offset);
-            offset += chunk.length;
-        });
-        audioQueueRef.current = [];
-
-        if (!audioContextRef.current || audioContextRef.current.state === 'closed') {
-            audioContextRef.current = new AudioContext({ sampleRate: 24000 });
-        }
-        if (audioContextRef.current.state === 'suspended') {
-            await audioContextRef.current.resume();
-        }
-
         try {
-            const pcmData = new Int16Array(concatenatedData.buffer);
-            const float32Data = new Float32Array(pcmData.length);
-            for (let i = 0; i < pcmData.length; i++) {
-                float32Data[i] = pcmData[i] / 32768.0;
+            if (!audioContextRef.current || audioContextRef.current.state === 'closed') {
+                audioContextRef.current = new AudioContext({ sampleRate: 24000 });
+                nextStartTimeRef.current = 0;
+            }
+            if (audioContextRef.current.state === 'suspended') {
+                await audioContextRef.current.resume();
             }
 
-            const audioBuffer = audioContextRef.current.createBuffer(1, float32Data.length, 24000);
-            audioBuffer.getChannelData(0).set(float32Data);
+            // resume을 기다리는 동안 도착한 청크까지 함께 가져옵니다.
+            const chunks = audioQueueRef.current;
+            audioQueueRef.current = [];
+            const totalLength = chunks.reduce((acc, val) => acc + val.length, 0);
+
+            // 청크를 하나로 합치는 중간 복사 없이 각 PCM 청크를 AudioBuffer 채널 데이터의 제자리에 바로 변환해 씁니다.
+            const audioContext = audioContextRef.current;
+            const audioBuffer = audioContext.createBuffer(1, totalLength, 24000);
+            const channelData = audioBuffer.getChannelData(0);
+            let offset = 0;
+            for (const pcmData of chunks) {
+                for (let i = 0; i < pcmData.length; i++) {
+                    channelData[offset + i] = pcmData[i] / 32768.0;
+                }
+                offset += pcmData.length;
+            }
 
-            const source = audioContextRef.current.createBufferSource();
+            const source = audioContext.createBufferSource();
             source.buffer = audioBuffer;
-            source.connect(audioContextRef.current.destination);
-            source.start();
+            source.connect(audioContext.destination);
+            const startTime = Math.max(audioContext.currentTime, nextStartTimeRef.current);
+            source.start(startTime);
+            nextStartTimeRef.current = startTime + audioBuffer.duration;
+            activeSourcesRef.current += 1;
 
             source.onended = () => {
-                isPlayingRef.current = false;
-                if (audioQueueRef.current.length > 0) {
-                    playAudioQueue();
-                } else {
+                activeSourcesRef.current -= 1;
+                if (activeSourcesRef.current === 0 && audioQueueRef.current.length === 0) {
                     setIsAISpeaking(false);
                 }
             };
         } catch (error) {
             console.error('🔴 Error playing audio:', error);
+            // resume 실패 등으로 재생할 수 없으면 남은 청크를 버려 같은 오류로 재진입을 반복하지 않도록 합니다.
+            audioQueueRef.current = [];
+            if (activeSourcesRef.current === 0) setIsAISpeaking(false);
+            return;
+        } finally {
             isPlayingRef.current = false;
-            setIsAISpeaking(false);
+        }
+
+        if (audioQueueRef.current.length > 0) {
+            playAudioQueue();
         }
     }, []);
 
@@ -175,6 +237,7 @@ function App() {
         if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) return;
         setConnectionStatus('Connecting...');
         const ws = new WebSocket('wss://live-voice-agent-backend-935733163938.asia-northeast3.run.app/ws');
+        ws.binaryType = 'arraybuffer';
         wsRef.current = ws;
 
         ws.onopen = () => {
@@ -183,9 +246,8 @@ function App() {
             console.log('✅ Connected to server');
         };
 
-        ws.onmessage = (event) => {
-            const data = JSON.parse(event.data);
-
+        // 서버 이벤트 하나를 처리하는 함수
+        const handleServerEvent = (data) => {
             // AI가 말하기 시작했다는 신호
             if (data.type === 'response.audio.started') {
                 setIsAISpeaking(true);
@@ -199,16 +261,18 @@ function App() {
                 return;
             }
 
-            if (data.type === 'audio' && data.audio) {
+            // 서버가 Azure의 response.audio.delta 이벤트를 그대로 전달합니다.
+            if (data.type === 'response.audio.delta' && data.delta) {
                 // AI가 말하고 있다는 것을 명시적으로 설정
                 if (!isAISpeaking) setIsAISpeaking(true);
 
-                const audioData = atob(data.audio);
+                const audioData = atob(data.delta);
                 const audioArray = new Uint8Array(audioData.length);
                 for (let i = 0; i < audioData.length; i++) {
                     audioArray[i] = audioData.charCodeAt(i);
                 }
-                audioQueueRef.current.push(audioArray);
+                // 큐에는 디코딩한 바이트를 Int16 PCM 뷰로 넣어 재생 시 바로 변환할 수 있게 합니다.
+                audioQueueRef.current.push(new Int16Array(audioArray.buffer));
                 if (!isPlayingRef.current) {
                     playAudioQueue();
                 }
@@ -226,6 +290,16 @@ function App() {
             }
         };
 
+        ws.onmessage = (event) => {
+            const payload = JSON.parse(typeof event.data === 'string' ? event.data : textDecoder.decode(event.data));
+            // 서버는 연달아 도착한 이벤트를 JSON 배열 하나로 묶어 보낼 수 있습니다.
+            if (Array.isArray(payload)) {
+                payload.forEach(handleServerEvent);
+            } else {
+                handleServerEvent(payload);
+            }
+        };
+
         ws.onerror = (error) => {
             console.error('🔴 WebSocket error:', error);
             setConnectionStatus('Error');